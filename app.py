@@ -1,10 +1,14 @@
 import streamlit as st
 import pandas as pd
-import joblib
+import numpy as np
+import pyarrow.parquet as pq
+import duckdb
 import os
-from utils.data_loader import load_all_data
+import atexit
+import contextlib
+from utils.data_loader import load_all_data, MASTER_CACHE_PATH
 from utils.feature_eng import build_master_dataset
-from utils.model_utils import preprocess_for_modeling
+from utils.model_utils import preprocess_for_modeling, load_feature_stats, load_artifacts, load_risk_session, predict_proba_onnx
 from utils.decision_logic import apply_decision_logic
 
 # Page Configuration
@@ -48,51 +52,156 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
+# Master columns used by the models and the dashboard pages
+REQUIRED_COLS = [
+    'Order_ID', 'Origin', 'Destination', 'Priority', 'Product_Category', 'Customer_Segment',
+    'Order_Value_INR', 'Distance_KM', 'Traffic_Delay_Minutes', 'delay_days', 'is_delayed',
+    'route_risk_score', 'vehicle_suitability_score', 'customer_dissatisfaction_risk',
+    'segment_avg_rating', 'segment_recommend_pct', 'total_cost',
+    'Fuel_Cost', 'Labor_Cost', 'Insurance', 'Packaging_Cost'
+]
+
+# Remaining master columns, carried only for the Control Tower CSV export
+EXPORT_COLS = [
+    'Order_Date', 'Special_Handling', 'order_dow', 'order_month', 'Carrier',
+    'Promised_Delivery_Days', 'Actual_Delivery_Days', 'Delivery_Status', 'Quality_Issue',
+    'Customer_Rating', 'Delivery_Cost_INR', 'Route', 'Fuel_Consumption_L', 'Toll_Charges_INR',
+    'Weather_Impact', 'Age_Years', 'Fuel_Efficiency_KM_per_L', 'Capacity_KG',
+    'CO2_Emissions_Kg_per_KM', 'Technology_Platform_Fee', 'Other_Overhead'
+]
+
+# Scored dataset persisted for per-page column reads (one file per app process,
+# so instances started from the same checkout don't overwrite each other)
+FINAL_CACHE_PATH = os.path.join('cache', f'final-{os.getpid()}.parquet')
+
+@st.cache_resource
+def load_models():
+    """
+    Loads model artifacts and the ONNX risk session once per process.
+    Kept out of st.cache_data so the models are never re-pickled.
+    """
+    return load_artifacts(), load_risk_session()
+
+@st.cache_data
+def load_dataframe():
+    """
+    Reads the cached master Parquet when present (see build_and_cache_master),
+    otherwise rebuilds it from the raw CSVs.
+    """
+    columns = REQUIRED_COLS + EXPORT_COLS
+    try:
+        return pd.read_parquet(MASTER_CACHE_PATH, columns=columns)
+    except FileNotFoundError:
+        data = load_all_data()
+        segment_stats, type_stats = load_feature_stats()
+        return build_master_dataset(data, segment_stats, type_stats)[columns]
+
+def score_dataset():
+    """
+    Runs the models and decision logic over the master dataset (uncached).
+    """
+    master = load_dataframe()
+    artifacts, risk_session = load_models()
+    
+    # Preprocess for Inference (reuse training-time category encodings)
+    processed_df, _ = preprocess_for_modeling(master, artifacts['encoders'])
+    
+    # Inference - Delay
+    delay_feats = [
+        'Distance_KM', 'route_risk_score', 'vehicle_suitability_score', 
+        'Traffic_Delay_Minutes', 'Priority', 'Origin', 'Product_Category'
+    ]
+    # Contiguous in the model's native dtype so predict skips its check_array copy
+    # (HistGradientBoosting bins against float64; the ONNX session takes float32)
+    X_delay = np.ascontiguousarray(processed_df[delay_feats].to_numpy(np.float64))
+    master['delay_probability'] = artifacts['delay'].predict_proba(X_delay)[:, 1]
+    
+    # Inference - Customer Risk
+    risk_feats = [
+         'segment_avg_rating', 'segment_recommend_pct', 'delay_days', 
+         'Priority', 'Order_Value_INR'
+    ]
+    X_risk = np.ascontiguousarray(processed_df[risk_feats].to_numpy(np.float32))
+    master['customer_risk_pred'] = predict_proba_onnx(risk_session, X_risk)[:, 1]
+    
+    # Apply Decision Logic
+    return apply_decision_logic(master)
+
+def remove_final_cache():
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(FINAL_CACHE_PATH)
+
+@st.cache_resource
+def register_final_cache_cleanup():
+    """
+    Deletes this process's page cache file on shutdown. Cached as a resource
+    so the handler is registered once per process, not on every rerun.
+    """
+    atexit.register(remove_final_cache)
+
+def write_final_cache(final_df):
+    register_final_cache_cleanup()
+    # Write to a temp file and swap it in so readers never see a partial file
+    os.makedirs(os.path.dirname(FINAL_CACHE_PATH), exist_ok=True)
+    tmp_path = FINAL_CACHE_PATH + '.tmp'
+    final_df.to_parquet(tmp_path, compression='zstd', row_group_size=50_000)
+    os.replace(tmp_path, FINAL_CACHE_PATH)
+
+def ensure_final_cache():
+    """
+    Returns FINAL_CACHE_PATH, re-scoring and rewriting the file if it was
+    removed while the st.cache_data result is still warm. Scoring is
+    deterministic, so rows stay aligned with the cached Origin masks.
+    """
+    if not os.path.exists(FINAL_CACHE_PATH):
+        write_final_cache(score_dataset())
+    return FINAL_CACHE_PATH
+
 @st.cache_data
 def load_and_prep_data_v2():
     """
     Loads data, builds master dataset, and applies models/logic.
     Version 2: Forces cache refresh to pick up new Cost Features.
+    The scored dataset is persisted to FINAL_CACHE_PATH; only the columns
+    needed by the sidebar are returned (pages read theirs via load_page_data),
+    together with a precomputed row mask per Origin for the warehouse filter.
     """
-    data = load_all_data()
-    master = build_master_dataset(data)
-    
-    # Load Models
-    models_dir = 'models'
     try:
-        delay_model = joblib.load(os.path.join(models_dir, 'delay_model.joblib'))
-        risk_model = joblib.load(os.path.join(models_dir, 'risk_model.joblib'))
-        # encoders = joblib.load(os.path.join(models_dir, 'encoders.joblib')) # Not used directly if we use pipeline or raw inference setup? 
-        # Actually verify_pipeline used them. Let's keep loading.
-        
-        # Preprocess for Inference
-        processed_df, _ = preprocess_for_modeling(master)
-        
-        # Inference - Delay
-        delay_feats = [
-            'Distance_KM', 'route_risk_score', 'vehicle_suitability_score', 
-            'Traffic_Delay_Minutes', 'Priority', 'Origin', 'Product_Category'
-        ]
-        master['delay_probability'] = delay_model.predict_proba(processed_df[delay_feats])[:, 1]
+        final_df = score_dataset()
+        write_final_cache(final_df)
         
-        # Inference - Customer Risk
-        risk_feats = [
-             'segment_avg_rating', 'segment_recommend_pct', 'delay_days', 
-             'Priority', 'Order_Value_INR'
-        ]
-        master['customer_risk_pred'] = risk_model.predict_proba(processed_df[risk_feats])[:, 1]
+        origins = final_df['Origin'].to_numpy()
+        origin_masks = {o: origins == o for o in final_df['Origin'].unique()}
         
-        # Apply Decision Logic
-        final_df = apply_decision_logic(master)
-        
-        return final_df
+        return final_df[['Order_ID', 'Origin']], origin_masks
         
     except Exception as e:
         st.error(f"Error loading models/data: {e}")
-        return pd.DataFrame()
+        return pd.DataFrame(), {}
+
+def load_page_data(columns, origin_mask):
+    """
+    Reads only `columns` of the scored dataset (skipping any not present),
+    restricted to the rows selected by `origin_mask`.
+    """
+    path = ensure_final_cache()
+    available = set(pq.read_schema(path).names)
+    page_df = pd.read_parquet(path, columns=[c for c in columns if c in available])
+    return page_df[origin_mask]
+
+def load_action_queue(selected_wh):
+    """
+    Orders needing intervention for the `selected_wh` warehouses; the filter
+    is pushed down into DuckDB's Parquet scan.
+    """
+    return duckdb.execute(
+        "SELECT * FROM read_parquet(?) "
+        "WHERE Action <> 'Standard Dispatch' AND list_contains(?::VARCHAR[], Origin)",
+        [ensure_final_cache(), list(selected_wh)]
+    ).df()
 
 # Load Data
-df = load_and_prep_data_v2()
+df, origin_masks = load_and_prep_data_v2()
 
 if df.empty:
     st.warning("Data could not be loaded. Please check the logs.")
@@ -110,11 +219,13 @@ page = st.sidebar.radio("Navigation", [
 ])
 
 st.sidebar.header("Global Filters")
-if not df.empty:
-    selected_wh = st.sidebar.multiselect("Select Warehouse", df['Origin'].unique(), default=df['Origin'].unique())
-    filtered_df = df[df['Origin'].isin(selected_wh)]
+origins = list(origin_masks)
+selected_wh = st.sidebar.multiselect("Select Warehouse", origins, default=origins)
+# OR together the precomputed per-Origin masks instead of re-scanning with isin
+if selected_wh:
+    origin_mask = np.logical_or.reduce([origin_masks[o] for o in selected_wh])
 else:
-    filtered_df = df
+    origin_mask = np.zeros(len(df), dtype=bool)
 
 # --- PAGE: ABOUT & SOLUTION ---
 if page == "ℹ️ About & Solution":
@@ -131,7 +242,7 @@ if page == "ℹ️ About & Solution":
     We moved from a static analysis to a **Predictive & Prescriptive** engine:
     1.  **Data Integration**: Unified 7 siloed datasets (Orders, Fleet, Feedback, etc.).
     2.  **Advanced Feature Engineering**: Created composite risk scores (`Route Risk`, `Vehicle Suitability`).
-    3.  **Machine Learning**: Trained Random Forest & Gradient Boosting models to predict delays and customer risk.
+    3.  **Machine Learning**: Trained Histogram Gradient Boosting & Gradient Boosting models to predict delays and customer risk.
     
     ### 💡 The Solution
     A **Decision Intelligence System** that doesn't just show charts, but drives action:
@@ -151,9 +262,12 @@ elif page == "📊 Executive Overview":
     # Top KPIs
     col1, col2, col3, col4 = st.columns(4)
     
+    cost_cols = ['Fuel_Cost', 'Labor_Cost', 'Vehicle_Maintenance', 'Insurance', 'Packaging_Cost']
+    filtered_df = load_page_data(['Origin', 'delay_days', 'is_delayed', 'delay_probability', 'total_cost'] + cost_cols, origin_mask)
+    
     avg_delay = filtered_df['delay_days'].mean()
-    on_time_pct = (filtered_df['is_delayed'] == 0).mean() * 100
-    risk_orders = (filtered_df['delay_probability'] > 0.5).sum()
+    on_time_pct = filtered_df.eval('is_delayed == 0').mean() * 100
+    risk_orders = filtered_df.eval('delay_probability > 0.5').sum()
     avg_cost = filtered_df['total_cost'].mean()
     
     col1.metric("On-Time Delivery %", f"{on_time_pct:.1f}%", f"{on_time_pct-95:.1f}% vs Target")
@@ -168,19 +282,20 @@ elif page == "📊 Executive Overview":
     # Chart 1: Delay by Route/Origin
     with col_a:
         st.subheader("Delay Risk by Origin")
-        origin_risk = filtered_df.groupby('Origin')['delay_probability'].mean().sort_values()
+        origin_risk = filtered_df.groupby('Origin', observed=True)['delay_probability'].mean().sort_values()
         st.bar_chart(origin_risk)
         
     # Chart 2: Cost Breakout
     with col_b:
         st.subheader("Cost Drivers Breakdown")
-        cost_cols = ['Fuel_Cost', 'Labor_Cost', 'Vehicle_Maintenance', 'Insurance', 'Packaging_Cost']
         # Filter only existing columns
         real_cost_cols = [c for c in cost_cols if c in filtered_df.columns]
         
         if real_cost_cols:
-            cost_sum = filtered_df[real_cost_cols].sum().reset_index()
-            cost_sum.columns = ['Cost Component', 'Total Amount']
+            cost_sum = pd.DataFrame({
+                'Cost Component': real_cost_cols,
+                'Total Amount': np.nansum(filtered_df[real_cost_cols].to_numpy(), axis=0)
+            })
             st.bar_chart(cost_sum, x='Cost Component', y='Total Amount', color='#FF4B4B')
     
 # --- PAGE 2: PREDICTIVE DELIVERY RISK ---
@@ -192,7 +307,11 @@ elif page == "🔮 Predictive Delivery Risk":
     # Slider for Risk Threshold
     threshold = st.slider("Risk Probability Threshold", 0.0, 1.0, 0.5)
     
-    risky_orders = filtered_df[filtered_df['delay_probability'] > threshold].sort_values('delay_probability', ascending=False)
+    filtered_df = load_page_data([
+        'Order_ID', 'Origin', 'Destination', 'Priority', 'delay_probability',
+        'route_risk_score', 'vehicle_suitability_score'
+    ], origin_mask)
+    risky_orders = filtered_df.query('delay_probability > @threshold', engine='numexpr').sort_values('delay_probability', ascending=False)
     
     st.dataframe(
         risky_orders[['Order_ID', 'Origin', 'Destination', 'Priority', 'delay_probability', 'route_risk_score', 'vehicle_suitability_score']],
@@ -224,12 +343,16 @@ elif page == "🔮 Predictive Delivery Risk":
 elif page == "😊 Customer Experience":
     st.title("😊 Customer Experience Intelligence")
     
+    filtered_df = load_page_data([
+        'Customer_Segment', 'customer_dissatisfaction_risk', 'delay_days', 'segment_avg_rating'
+    ], origin_mask)
+    
     col1, col2 = st.columns(2)
     with col1:
         st.subheader("Dissatisfaction Risk by Segment")
         # Ensure we have satisfaction data
         if 'customer_dissatisfaction_risk' in filtered_df.columns:
-            seg_risk = filtered_df.groupby('Customer_Segment')['customer_dissatisfaction_risk'].mean()
+            seg_risk = filtered_df.groupby('Customer_Segment', observed=True)['customer_dissatisfaction_risk'].mean()
             st.bar_chart(seg_risk)
             
     with col2:
@@ -242,7 +365,7 @@ elif page == "⭐ Operational Control Tower":
     st.markdown("manage and resolve delivery risks proactively.")
     
     # KPIs for Ops
-    ops_df = filtered_df[filtered_df['Action'] != 'Standard Dispatch']
+    ops_df = load_action_queue(selected_wh)
     
     kpi1, kpi2, kpi3 = st.columns(3)
     kpi1.metric("Pending Interventions", len(ops_df), "High Priority", delta_color="inverse")
@@ -1,13 +1,16 @@
-from utils.data_loader import load_all_data
-from utils.feature_eng import build_master_dataset
-from utils.model_utils import preprocess_for_modeling, train_delay_model, train_customer_risk_model, save_artifacts
+from utils.data_loader import load_all_data, build_and_cache_master
+from utils.feature_eng import compute_segment_stats, compute_type_stats
+from utils.model_utils import preprocess_for_modeling, train_delay_model, train_customer_risk_model, save_artifacts, save_feature_stats, export_onnx
 
 def main():
     print("1. Loading Data...")
     data = load_all_data()
     
     print("2. Building Master Dataset...")
-    master = build_master_dataset(data)
+    segment_stats = compute_segment_stats(data['feedback'], data['orders'])
+    type_stats = compute_type_stats(data['fleet'])
+    save_feature_stats(segment_stats, type_stats)
+    master = build_and_cache_master(data, segment_stats=segment_stats, type_stats=type_stats)
     
     print("3. Preprocessing...")
     processed_df, encoders = preprocess_for_modeling(master)
@@ -20,7 +23,8 @@ def main():
     risk_model = train_customer_risk_model(processed_df)
     
     print("\n6. Saving Artifacts...")
-    save_artifacts(delay_model, risk_model, encoders)
+    save_artifacts(delay_model, encoders)
+    export_onnx(risk_model)
     
 if __name__ == "__main__":
     main()
@@ -1,14 +1,20 @@
 import pandas as pd
 import os
+from concurrent.futures import ThreadPoolExecutor
+from utils.feature_eng import build_master_dataset
 
 DATA_DIR = 'data'
+MASTER_CACHE_PATH = os.path.join(DATA_DIR, 'processed', 'master.parquet')
+
+# Low-cardinality string columns stored as pandas Categorical
+CATEGORICAL_COLS = ['Origin', 'Destination', 'Priority', 'Product_Category', 'Customer_Segment', 'Weather_Impact', 'Carrier']
 
 def load_dataset(filename):
     """Loads a CSV dataset from the data directory."""
     path = os.path.join(DATA_DIR, filename)
     if not os.path.exists(path):
         raise FileNotFoundError(f"File not found: {path}")
-    return pd.read_csv(path)
+    return pd.read_csv(path, engine='pyarrow')
 
 def load_all_data():
     """
@@ -26,15 +32,36 @@ def load_all_data():
         'costs': 'cost_breakdown.csv'
     }
 
+    # Parsing releases the GIL, so the files are read concurrently
+    with ThreadPoolExecutor(max_workers=len(datasets)) as executor:
+        futures = {key: executor.submit(load_dataset, filename) for key, filename in datasets.items()}
+
     for key, filename in datasets.items():
         try:
-            data[key] = load_dataset(filename)
+            data[key] = futures[key].result()
             # Standardize date columns if applicable
             for col in data[key].columns:
                 if 'Date' in col:
                     data[key][col] = pd.to_datetime(data[key][col], errors='coerce')
+            for col in CATEGORICAL_COLS:
+                if col in data[key].columns:
+                    data[key][col] = data[key][col].astype('category')
         except Exception as e:
             print(f"Error loading {filename}: {e}")
             data[key] = None
             
     return data
+
+def build_and_cache_master(data=None, path=MASTER_CACHE_PATH, segment_stats=None, type_stats=None):
+    """
+    Builds the master dataset once and caches it as Parquet so the app can
+    skip CSV parsing and feature engineering on cold start.
+    Re-run after the raw CSVs change.
+    """
+    if data is None:
+        data = load_all_data()
+    master = build_master_dataset(data, segment_stats, type_stats)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    master.to_parquet(path, compression='zstd', index=False)
+    return master
@@ -0,0 +1,28 @@
+import numpy as np
+import numba
+
+# Action codes produced by classify_actions:
+# 0-3 = RULE 1-4 (see decision_logic.RULE_OUTCOMES), 4 = Standard Dispatch
+DEFAULT_ACTION_CODE = 4
+
+@numba.njit(parallel=True, cache=True)
+def classify_actions(delay_prob, route_risk, vehicle_score, is_critical_cust):
+    """
+    Compiled rule engine: returns an int8 action code per order.
+    Rules are checked in priority order; codes index decision_logic.RULE_OUTCOMES.
+    """
+    n = delay_prob.shape[0]
+    out = np.empty(n, dtype=np.int8)
+    for i in numba.prange(n):
+        dp = delay_prob[i] * 100
+        if dp > 60 and is_critical_cust[i]:
+            out[i] = 0
+        elif route_risk[i] > 70:
+            out[i] = 1
+        elif vehicle_score[i] < 40 and dp > 40:
+            out[i] = 2
+        elif is_critical_cust[i]:
+            out[i] = 3
+        else:
+            out[i] = DEFAULT_ACTION_CODE
+    return out
@@ -1,37 +1,48 @@
 import pandas as pd
 import numpy as np
+import numexpr as ne
 
 def create_delivery_features(delivery_df):
     """
     Calculates delivery delay and delay status.
+    Returns only Order_ID and the new columns (no copy of the input frame).
     """
-    df = delivery_df.copy()
-    df['delay_days'] = df['Actual_Delivery_Days'] - df['Promised_Delivery_Days']
-    df['is_delayed'] = (df['delay_days'] > 0).astype(int)
-    return df
+    delay_days = delivery_df['Actual_Delivery_Days'] - delivery_df['Promised_Delivery_Days']
+    return pd.DataFrame({
+        'Order_ID': delivery_df['Order_ID'],
+        'delay_days': delay_days,
+        'is_delayed': (delay_days > 0).astype(int)
+    })
+
+# Weather: categorical -> numeric risk lookup (indexed by category code)
+WEATHER_CATEGORIES = ['Clear', 'Cloudy', 'Rain', 'Fog', 'Storm']
+WEATHER_RISK = np.array([0.0, 0.2, 0.5, 0.7, 1.0])
 
 def create_route_features(routes_df):
     """
     Calculates route risk score based on traffic and weather.
+    Returns only Order_ID and route_risk_score (no copy of the input frame).
     """
-    df = routes_df.copy()
-    
     # Normalize inputs for risk score (simple heuristic)
     # Traffic: 0-120 mins -> 0-1
-    traffic_score = df['Traffic_Delay_Minutes'] / df['Traffic_Delay_Minutes'].max()
-    
-    # Weather: Map categorical to numeric risk
-    weather_map = {'Clear': 0, 'Rain': 0.5, 'Storm': 1.0, 'Fog': 0.7, 'Cloudy': 0.2} 
-    # Fallback to 0 if unknown
-    weather_risk = df['Weather_Impact'].map(weather_map).fillna(0)
-    
-    # Composite Risk Score (0-100 scale)
-    df['route_risk_score'] = ((traffic_score * 0.6) + (weather_risk * 0.4)) * 100
-    return df
+    traffic = routes_df['Traffic_Delay_Minutes'].to_numpy(dtype=np.float64)
+    traffic_max = routes_df['Traffic_Delay_Minutes'].max()
+    
+    # Weather: gather risk by category code; unknown (code -1) falls back to 0
+    codes = pd.Index(WEATHER_CATEGORIES).get_indexer(routes_df['Weather_Impact'])
+    weather_risk = np.where(codes >= 0, WEATHER_RISK[codes.clip(0)], 0.0)
+    
+    # Composite Risk Score (0-100 scale), fused into a single numexpr pass
+    route_risk_score = ne.evaluate(
+        '(t / tmax * 0.6 + w * 0.4) * 100',
+        local_dict={'t': traffic, 'tmax': float(traffic_max), 'w': weather_risk}
+    )
+    return pd.DataFrame({'Order_ID': routes_df['Order_ID'], 'route_risk_score': route_risk_score})
 
-def create_vehicle_features(fleet_df, delivery_df):
+def compute_type_stats(fleet_df):
     """
-    Aggregates vehicle features by Type and maps to orders via Delivery Carrier.
+    Aggregates fleet stats by Vehicle_Type and scores vehicle suitability.
+    Computed at train time and saved as a lookup table (see save_feature_stats).
     """
     # 1. Aggregate fleet stats by Vehicle_Type
     type_stats = fleet_df.groupby('Vehicle_Type').agg({
@@ -48,6 +59,17 @@ def create_vehicle_features(fleet_df, delivery_df):
     eff_score = type_stats['Fuel_Efficiency_KM_per_L'] / type_stats['Fuel_Efficiency_KM_per_L'].max()
     
     type_stats['vehicle_suitability_score'] = ((age_score + eff_score) / 2) * 100
+    return type_stats
+
+def create_vehicle_features(fleet_df, delivery_df, precomputed_type_stats=None):
+    """
+    Aggregates vehicle features by Type and maps to orders via Delivery Carrier.
+    Skips the fleet aggregation when `precomputed_type_stats` is provided.
+    """
+    if precomputed_type_stats is not None:
+        type_stats = precomputed_type_stats
+    else:
+        type_stats = compute_type_stats(fleet_df)
     
     # 3. Map to Delivery DF
     # Issue: Delivery has 'Carrier' (e.g. GlobalTransit), Fleet has 'Vehicle_Type' (e.g. Large_Truck)
@@ -63,17 +85,29 @@ def create_vehicle_features(fleet_df, delivery_df):
         'ReliableExpress': 'Medium_Truck'
     }
     
-    delivery_df_mod = delivery_df.copy()
-    delivery_df_mod['Vehicle_Type_Mapped'] = delivery_df_mod['Carrier'].map(carrier_map).fillna('Medium_Truck')
+    vehicle_map = pd.DataFrame({
+        'Order_ID': delivery_df['Order_ID'],
+        'Vehicle_Type_Mapped': delivery_df['Carrier'].map(carrier_map).fillna('Medium_Truck')
+    })
     
     # Now merge on Mapped Type
-    vehicle_map = delivery_df_mod[['Order_ID', 'Vehicle_Type_Mapped']]
     vehicle_features = vehicle_map.merge(type_stats, left_on='Vehicle_Type_Mapped', right_on='Vehicle_Type', how='left')
     
     return vehicle_features.drop(columns=['Vehicle_Type_Mapped', 'Vehicle_Type'])
 
 
-def create_customer_features(feedback_df, orders_df):
+def compute_segment_stats(feedback_df, orders_df):
+    """
+    Calculates Segment-Level Risk stats (avg rating, % would recommend).
+    Computed at train time and saved as a lookup table (see save_feature_stats).
+    """
+    merged = pd.merge(orders_df[['Order_ID', 'Customer_Segment']], feedback_df, on='Order_ID', how='left')
+    return merged.groupby('Customer_Segment', observed=True).agg({
+        'Rating': 'mean',
+        'Would_Recommend': lambda x: (x == 'Yes').mean() * 100
+    }).rename(columns={'Rating': 'segment_avg_rating', 'Would_Recommend': 'segment_recommend_pct'}).reset_index()
+
+def create_customer_features(feedback_df, orders_df, precomputed_segment_stats=None):
     """
     Creates customer risk profile based on Customer_Segment historical performance.
     Since we lack Customer_ID on Orders, we assume risk is segment-based 
@@ -81,16 +115,17 @@ def create_customer_features(feedback_df, orders_df):
     and segment averages for future prediction.
     
     For this prototype: We will enable 'Order Level' risk targets.
+    Skips the segment aggregation when `precomputed_segment_stats` is provided.
     """
     # feedback_df has Order_ID, Rating, Issue_Category
     # Merge feedback to orders to get Segment info
     merged = pd.merge(orders_df[['Order_ID', 'Customer_Segment']], feedback_df, on='Order_ID', how='left')
     
     # Calculate Segment-Level Risk stats
-    segment_stats = merged.groupby('Customer_Segment').agg({
-        'Rating': 'mean',
-        'Would_Recommend': lambda x: (x == 'Yes').mean() * 100
-    }).rename(columns={'Rating': 'segment_avg_rating', 'Would_Recommend': 'segment_recommend_pct'}).reset_index()
+    if precomputed_segment_stats is not None:
+        segment_stats = precomputed_segment_stats
+    else:
+        segment_stats = compute_segment_stats(feedback_df, orders_df)
     
     # Merge segment stats back to orders
     merged = merged.merge(segment_stats, on='Customer_Segment', how='left')
@@ -108,16 +143,19 @@ def create_cost_features(cost_df):
     """
     df = cost_df.copy()
     cost_cols = [c for c in df.columns if 'Cost' in c or 'Fee' in c or 'Insurance' in c or 'Overhead' in c]
-    df['total_cost'] = df[cost_cols].sum(axis=1)
+    # Row-wise total over a contiguous float32 block; missing components count as 0 (as in DataFrame.sum)
+    costs = df[cost_cols].to_numpy(dtype=np.float32)
+    df['total_cost'] = np.nansum(costs, axis=1)
     # Return Order_ID, total_cost, and all component columns
     return_cols = ['Order_ID', 'total_cost'] + cost_cols
     # Ensure no duplicates if Order_ID was in cost_cols (unlikely but safe)
     return_cols = list(set(return_cols)) 
     return df[return_cols]
 
-def build_master_dataset(data_dict):
+def build_master_dataset(data_dict, segment_stats=None, type_stats=None):
     """
     Orchestrates the feature engineering and merging.
+    Optional precomputed segment/type stats skip the corresponding groupbys.
     """
     orders = data_dict['orders']
     
@@ -133,20 +171,25 @@ def build_master_dataset(data_dict):
     route_feat = create_route_features(data_dict['routes'])
     
     # 4. Vehicle Features
-    veh_feat = create_vehicle_features(data_dict['fleet'], data_dict['delivery'])
+    veh_feat = create_vehicle_features(data_dict['fleet'], data_dict['delivery'], type_stats)
     
     # 5. Customer Features
-    cust_feat = create_customer_features(data_dict['feedback'], orders)
+    cust_feat = create_customer_features(data_dict['feedback'], orders, segment_stats)
     
     # 6. Cost Features
     cost_feat = create_cost_features(data_dict['costs'])
     
     # --- MERGE ALL ---
-    master = orders.merge(del_feat, on='Order_ID', how='left')
-    master = master.merge(route_feat, on='Order_ID', how='left')
-    master = master.merge(veh_feat, on='Order_ID', how='left')
-    master = master.merge(cust_feat, on='Order_ID', how='left')
-    master = master.merge(cost_feat, on='Order_ID', how='left')
+    # Index every frame on Order_ID once and join them in a single pass
+    # (raw delivery/route columns are joined alongside their new feature columns)
+    features = [
+        feat.set_index('Order_ID')
+        for feat in (
+            data_dict['delivery'], del_feat, data_dict['routes'], route_feat,
+            veh_feat, cust_feat, cost_feat
+        )
+    ]
+    master = orders.set_index('Order_ID').join(features, how='left').reset_index()
     
     # Fill risks for new orders (simulated) with 0 or mean
     master['route_risk_score'] = master['route_risk_score'].fillna(master['route_risk_score'].median())
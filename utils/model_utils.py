@@ -1,19 +1,22 @@
 import pandas as pd
 import numpy as np
 from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier
+from sklearn.ensemble import HistGradientBoostingClassifier, GradientBoostingClassifier
+from sklearn.inspection import permutation_importance
 from sklearn.metrics import classification_report, accuracy_score
-from sklearn.preprocessing import LabelEncoder
 import joblib
 import os
+import onnxruntime as ort
 
 MODELS_DIR = 'models'
 if not os.path.exists(MODELS_DIR):
     os.makedirs(MODELS_DIR)
 
-def preprocess_for_modeling(master_df):
+def preprocess_for_modeling(master_df, encoders=None):
     """
     Encodes categorical variables and handles missing values for modeling.
+    Categoricals are encoded as pandas category codes. Pass the `encoders`
+    returned at training time to reuse their categories (unseen values -> -1).
     """
     df = master_df.copy()
     
@@ -26,26 +29,36 @@ def preprocess_for_modeling(master_df):
     # Features: Priority, Segment Stats, Delay (historical/actual for training), Order Value
     
     # Handle Categoricals
-    le = LabelEncoder()
     cat_cols = ['Priority', 'Origin', 'Destination', 'Product_Category', 'Customer_Segment', 'Weather_Impact']
     
-    encoders = {}
+    fit = encoders is None
+    if fit:
+        encoders = {}
     for col in cat_cols:
         if col in df.columns:
-            # fillna first
-            df[col] = df[col].fillna('Unknown')
-            df[col] = le.fit_transform(df[col].astype(str))
-            encoders[col] = le
+            # fillna first (via object, since 'Unknown' may not be a category yet)
+            values = df[col].astype(object).fillna('Unknown').astype(str)
+            if fit:
+                cat = values.astype('category')
+                encoders[col] = list(cat.cat.categories)
+                codes = cat.cat.codes
+            else:
+                codes = pd.Index(encoders[col]).get_indexer(values)
+            df[col] = codes.astype(np.int32)
             
     # Fill remaining numeric NaNs
     numeric_cols = df.select_dtypes(include=[np.number]).columns
     df[numeric_cols] = df[numeric_cols].fillna(0)
     
+    # Downcast to float32: tree models compare thresholds in float32 anyway
+    float_cols = df.select_dtypes(include=['float64']).columns
+    df[float_cols] = df[float_cols].astype(np.float32)
+    
     return df, encoders
 
 def train_delay_model(df):
     """
-    Trains valid Random Forest model for Delay Prediction.
+    Trains Histogram Gradient Boosting model for Delay Prediction.
     """
     target = 'is_delayed'
     features = [
@@ -56,22 +69,24 @@ def train_delay_model(df):
     # Filter only rows where we have the target (Delivery Performance data exists)
     train_df = df.dropna(subset=[target])
     
-    X = train_df[features]
+    # Plain contiguous float64 matrix: the app scores with the same layout (no feature names)
+    X = np.ascontiguousarray(train_df[features].to_numpy(np.float64))
     y = train_df[target]
     
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
     
-    model = RandomForestClassifier(n_estimators=100, max_depth=10, random_state=42)
+    model = HistGradientBoostingClassifier(max_iter=200, max_depth=8, learning_rate=0.05, random_state=42)
     model.fit(X_train, y_train)
     
     print("--- Delay Prediction Model ---")
     y_pred = model.predict(X_test)
     print(classification_report(y_test, y_pred))
     
-    # Feature Importance
+    # Feature Importance (permutation-based; HistGradientBoosting has no impurity importances)
+    perm = permutation_importance(model, X_test, y_test, n_repeats=10, random_state=42)
     importances = pd.DataFrame({
         'feature': features,
-        'importance': model.feature_importances_
+        'importance': perm.importances_mean
     }).sort_values('importance', ascending=False)
     
     return model, importances
@@ -103,8 +118,68 @@ def train_customer_risk_model(df):
     
     return model
 
-def save_artifacts(delay_model, risk_model, encoders):
-    joblib.dump(delay_model, os.path.join(MODELS_DIR, 'delay_model.joblib'))
-    joblib.dump(risk_model, os.path.join(MODELS_DIR, 'risk_model.joblib'))
-    joblib.dump(encoders, os.path.join(MODELS_DIR, 'encoders.joblib'))
-    print("Models and encoders saved.")
+ARTIFACTS_PATH = os.path.join(MODELS_DIR, 'artifacts.joblib')
+# The delay model (HistGradientBoosting) is served natively: its predict is
+# already a compiled kernel, and skl2onnx cannot currently export it.
+RISK_ONNX_PATH = os.path.join(MODELS_DIR, 'risk.onnx')
+
+def save_artifacts(delay_model, encoders):
+    # Single uncompressed file so load_artifacts can memory-map the model arrays;
+    # the risk model is served from its ONNX export (see export_onnx)
+    artifacts = {'delay': delay_model, 'encoders': encoders}
+    joblib.dump(artifacts, ARTIFACTS_PATH, compress=0, protocol=5)
+    print("Delay model and encoders saved.")
+
+def load_artifacts():
+    """
+    Loads {'delay', 'encoders'}; NumPy arrays inside the delay model are
+    memory-mapped read-only instead of copied onto the heap.
+    """
+    return joblib.load(ARTIFACTS_PATH, mmap_mode='r')
+
+def save_feature_stats(segment_stats, type_stats):
+    segment_stats.to_parquet(os.path.join(MODELS_DIR, 'segment_stats.parquet'), index=False)
+    type_stats.to_parquet(os.path.join(MODELS_DIR, 'type_stats.parquet'), index=False)
+    print("Feature lookup tables saved.")
+
+def load_feature_stats():
+    """
+    Loads the segment/type lookup tables saved at train time.
+    Returns (None, None) if they have not been generated yet.
+    """
+    try:
+        segment_stats = pd.read_parquet(os.path.join(MODELS_DIR, 'segment_stats.parquet'))
+        type_stats = pd.read_parquet(os.path.join(MODELS_DIR, 'type_stats.parquet'))
+    except FileNotFoundError:
+        return None, None
+    return segment_stats, type_stats
+
+def export_onnx(risk_model):
+    """
+    Exports the risk model to ONNX (float32 input, plain probability matrix output)
+    so inference can run in onnxruntime's tree-ensemble kernel.
+    """
+    # Training-time only; keep the converter out of the dashboard's imports
+    from skl2onnx import convert_sklearn
+    from skl2onnx.common.data_types import FloatTensorType
+    
+    onx = convert_sklearn(
+        risk_model,
+        initial_types=[('input', FloatTensorType([None, risk_model.n_features_in_]))],
+        options={id(risk_model): {'zipmap': False}}
+    )
+    with open(RISK_ONNX_PATH, 'wb') as f:
+        f.write(onx.SerializeToString())
+    print("ONNX model saved.")
+
+def load_risk_session():
+    """
+    Returns the onnxruntime inference session for the risk model.
+    """
+    return ort.InferenceSession(RISK_ONNX_PATH, providers=['CPUExecutionProvider'])
+
+def predict_proba_onnx(session, X):
+    """
+    predict_proba equivalent for an exported model; X is cast to float32.
+    """
+    return session.run(['probabilities'], {'input': np.asarray(X, dtype=np.float32)})[0]
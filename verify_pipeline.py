@@ -34,8 +34,8 @@ def verify():
             print(nans[nans > 0])
         
         # Save for inspection
-        master.to_csv('master_debug.csv', index=False)
-        print("\nSaved 'master_debug.csv' for inspection.")
+        master.to_parquet('master_debug.parquet', compression='snappy', index=False)
+        print("\nSaved 'master_debug.parquet' for inspection.")
         
     except Exception as e:
         print(f"CRITICAL ERROR: {e}")